@@ -1,7 +1,12 @@
 # main.py
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 from datetime import datetime
 
 # Import your processing modules
@@ -10,11 +15,31 @@ from app.sort import process_sort
 from app.orderby import process_orderby
 from app.read_statement import process_read
 
-app = FastAPI()
+
+def new_batch_executor() -> ProcessPoolExecutor:
+    # Worker processes for batch requests: the stages are CPU-bound pure functions,
+    # so separate processes (not threads) let payloads run on all cores.
+    return ProcessPoolExecutor(max_workers=os.cpu_count())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Created here rather than at import, so worker processes importing this
+    # module do not start pools of their own.
+    app.state.batch_executor = new_batch_executor()
+    try:
+        yield
+    finally:
+        app.state.batch_executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Payload structure
 class Payload(BaseModel):
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     pgm_name: str
     inc_name: str
     type: str
@@ -25,6 +50,8 @@ class Payload(BaseModel):
 
 # Response structure
 class ResponseModel(BaseModel):
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     pgm_name: str
     inc_name: str
     type: str
@@ -34,7 +61,7 @@ class ResponseModel(BaseModel):
     remediated_code: str
 
 
-async def process_abap_code(payload: Payload) -> ResponseModel:
+def process_abap_code_sync(payload: Payload) -> ResponseModel:
     """
     Process ABAP code through select, sort, orderby, read_statement modules
     sequentially and add Pwc tag where required.
@@ -65,7 +92,37 @@ async def process_abap_code(payload: Payload) -> ResponseModel:
     )
 
 
+async def process_abap_code(payload: Payload) -> ResponseModel:
+    return process_abap_code_sync(payload)
+
+
 @app.post("/remediate_abap", response_model=ResponseModel)
 async def remediate_abap(payload: Payload):
     return await process_abap_code(payload)
 
+
+@app.post("/remediate_abap_batch", response_model=List[ResponseModel])
+async def remediate_abap_batch(payloads: List[Payload]):
+    """
+    Remediate several programs/includes in one request; each payload is
+    processed independently in the worker pool and results keep request order.
+    """
+    loop = asyncio.get_running_loop()
+
+    def run_batch(executor: ProcessPoolExecutor):
+        return asyncio.gather(*(
+            loop.run_in_executor(executor, process_abap_code_sync, payload)
+            for payload in payloads
+        ))
+
+    executor = app.state.batch_executor
+    try:
+        return await run_batch(executor)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OS) and a broken pool rejects all
+        # further work: replace it, unless a concurrent request already has,
+        # and run the batch once more.
+        if app.state.batch_executor is executor:
+            app.state.batch_executor = new_batch_executor()
+            executor.shutdown(wait=False)
+        return await run_batch(app.state.batch_executor)
\ No newline at end of file
@@ -0,0 +1,30 @@
+# app/common.py
+
+import os
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def make_pwc_tag_line(today: date) -> str:
+    """PwC tag comment line (with trailing newline) inserted next to each remediated statement."""
+    # Keyed on the date, so a long-running service still rolls over at midnight
+    return f'" Added By Pwc {today.isoformat()}\n'
+
+
+def map_in_processes(fn: Callable[[str], str], codes: list[str],
+                     executor: Executor | None = None) -> list[str]:
+    """
+    Apply a stage function (e.g. process_sort) to several sources, sharded
+    across worker processes; the stages are CPU-bound and share no state
+    between sources. Pass executor to reuse an existing pool, otherwise one
+    is started for this call. Results keep the input order.
+    """
+    if len(codes) < 2:
+        return [fn(code) for code in codes]
+    if executor is not None:
+        return list(executor.map(fn, codes, chunksize=16))
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        return list(ex.map(fn, codes, chunksize=16))
\ No newline at end of file
@@ -0,0 +1,72 @@
+# app/lex.py
+
+import re
+
+# Characters that open a literal or an inline comment; '*' comments (column 1
+# only) are located separately so this stays a plain character-set scan
+_LEX_STOP_RE = re.compile(r'["\'`|]')
+
+
+def _next_star_comment(code: str, i: int) -> int:
+    # Offset of the first '*' in column 1 at or after i, or -1
+    if i == 0 and code.startswith('*'):
+        return 0
+    p = code.find('\n*', i - 1 if i > 0 else 0)
+    return -1 if p == -1 else p + 1
+
+
+def code_regions(code: str) -> list[tuple[int, int]]:
+    """
+    Scan ABAP source once and return the (start, end) slabs of real code, i.e.
+    everything outside string literals ('...', `...`, |...|) and comments
+    (" inline, * full-line). Slabs are ordered and do not overlap.
+    """
+    regions = []
+    n = len(code)
+    i = 0
+    star = _next_star_comment(code, 0)
+    while i < n:
+        if star != -1 and star < i:
+            # that one was inside a literal or comment
+            star = _next_star_comment(code, i)
+        m = _LEX_STOP_RE.search(code, i, n if star == -1 else star)
+        if m:
+            j = m.start()
+        elif star != -1:
+            j = star
+        else:
+            regions.append((i, n))
+            break
+        if j > i:
+            regions.append((i, j))
+        c = code[j]
+        if c == '"' or c == '*':
+            # comment up to (not including) the end of line
+            eol = code.find('\n', j)
+            if eol == -1:
+                break
+            i = eol
+            continue
+        # jump to the closing delimiter; a doubled delimiter is an escape
+        k = code.find(c, j + 1)
+        while k != -1 and k + 1 < n and code[k+1] == c:
+            k = code.find(c, k + 2)
+        if k == -1:
+            # unterminated literal runs to the end of the source
+            break
+        i = k + 1
+    return regions
+
+
+def statement_periods(code: str, regions: list[tuple[int, int]]) -> list[int]:
+    """
+    Offsets of every statement-terminating period, i.e. each '.' that lies in
+    one of the code slabs returned by code_regions(). The list is ascending.
+    """
+    periods = []
+    for a, b in regions:
+        p = code.find('.', a, b)
+        while p != -1:
+            periods.append(p)
+            p = code.find('.', p + 1, b)
+    return periods
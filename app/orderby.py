@@ -1,8 +1,58 @@
 # app/orderby.py
 
+import io
 import re
+import string
+from bisect import bisect_left, bisect_right
 from datetime import date
 
+from app.common import make_pwc_tag_line
+from app.lex import code_regions, statement_periods
+
+# Patterns compiled once at import instead of on every statement/field.
+_BARE_IDENT_RE = re.compile(r'^[A-Za-z_]\w*(~[A-Za-z_]\w*)?$')
+# FOR ALL ENTRIES / ORDER BY / WHERE, matched together in a single sweep. This and
+# the other keyword scanners below run over the ASCII-lowercased source, so no case
+# folding is needed (IGNORECASE would also fold look-alikes such as 'ſ' and the Kelvin sign)
+_CLAUSE_RE = re.compile(
+    r'(?P<fae>\bfor\s+all\s+entries\b)|(?P<order>\border\s+by\b)|(?P<where>\bwhere\b)'
+)
+# Characters that matter while splitting a SELECT list
+_FIELD_STOP_RE = re.compile(r"[,()'`|\s]")
+_SPACE_RUN_RE = re.compile(r'\s*')
+# For WHERE clause end, look for next clause keyword
+_WHERE_TERMINATORS = [
+    'group', 'having', 'order', 'into', 'appending', 'up', 'for', 'bypassing',
+    'union', 'intersect', 'except', 'client', 'using', 'package'
+]
+_WHERE_TERM_RE = re.compile(r'\b(' + '|'.join(_WHERE_TERMINATORS) + r')\b')
+# SELECT as the first token of a line
+_SELECT_LEAD_RE = re.compile(r'^[ \t]*(?P<kw>select)\b', re.MULTILINE)
+
+# Word-character flags for Latin-1; anything above falls back to str.isalnum()
+_WORD_CHR = bytes(1 if (chr(i).isalnum() or i == 0x5F) else 0 for i in range(256))
+
+# ASCII-only lower-casing keeps offsets identical to the original source
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _is_word_char(c: str) -> bool:
+    o = ord(c)
+    return _WORD_CHR[o] == 1 if o < 256 else c.isalnum()
+
+
+def _find_as(text: str) -> int:
+    """Offset of the first standalone AS keyword in text (any case), or -1."""
+    low = text.lower() if text.isascii() else text.translate(_ASCII_LOWER)
+    end = len(text)
+    k = low.find('as')
+    while k != -1:
+        if (k == 0 or not _is_word_char(text[k-1])) and (k + 2 == end or not _is_word_char(text[k+2])):
+            return k
+        k = low.find('as', k + 1)
+    return -1
+
+
 def process_orderby(code: str) -> str:
     """
     Remediate ABAP SELECT statements that:
@@ -26,252 +76,53 @@ def process_orderby(code: str) -> str:
       - Strings: '...', `...`, |...|
     """
 
-    pwc_tag_line = f'" Added By Pwc {date.today().isoformat()}\n'
+    # Lower-cased once so keyword probes are plain substring searches
+    code_lower = code.lower() if code.isascii() else code.translate(_ASCII_LOWER)
 
-    # --- Utilities for lexical scanning ------------------------------
+    # Nothing to remediate without a SELECT anywhere; skip lexing entirely
+    if 'select' not in code_lower:
+        return code
 
-    def is_word_char(c: str) -> bool:
-        return c.isalnum() or c == '_'
+    pwc_tag_line = make_pwc_tag_line(date.today())
 
-    def match_kw_at(s: str, i: int, kw: str) -> bool:
-        n = len(kw)
-        if i < 0 or i + n > len(s):
-            return False
-        if s[i:i+n].lower() != kw.lower():
-            return False
-        left_ok = (i == 0) or (not is_word_char(s[i-1]))
-        right_ok = (i + n == len(s)) or (not is_word_char(s[i+n]))
-        return left_ok and right_ok
-
-    def skip_line_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '"'
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def skip_full_line_star_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '*' and it's at BOL
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def find_statement_period(s: str, start: int) -> int:
-        # Finds the position of the terminating '.' of the statement starting at 'start'
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i)
-                    continue
-                if c == '*':
-                    # full-line comment only at BOL
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i)
-                        continue
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-                if c == '.':
-                    return i
-                i += 1
-                continue
-            # inside strings/templates
-            if in_sq:
-                if c == "'":
-                    if i + 1 < n and s[i+1] == "'":
-                        i += 2
-                        continue
-                    in_sq = False
-                i += 1
-                continue
-            if in_bt:
-                if c == '`':
-                    if i + 1 < n and s[i+1] == '`':
-                        i += 2
-                        continue
-                    in_bt = False
-                i += 1
-                continue
-            if in_tpl:
-                if c == '|':
-                    if i + 1 < n and s[i+1] == '|':
-                        i += 2
-                        continue
-                    in_tpl = False
-                i += 1
-                continue
-        return -1
+    # --- Utilities for lexical scanning ------------------------------
 
-    def find_kw(s: str, kw: str, start: int = 0) -> int:
-        # Finds next occurrence of keyword outside strings/comments
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i) + 1
-                    continue
-                if c == '*':
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i) + 1
-                        continue
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-                if match_kw_at(s, i, kw):
-                    return i
-                i += 1
-                continue
-            else:
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            i += 2
-                            continue
-                        in_sq = False
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            i += 2
-                            continue
-                        in_bt = False
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            i += 2
-                            continue
-                        in_tpl = False
-                    i += 1
-                    continue
-        return -1
+    # The source is lexed once into code slabs; all lookups below are bounded to
+    # one statement and consult the slabs instead of re-walking strings and comments.
+    regions = code_regions(code)
+    region_starts = [a for a, _ in regions]
+    periods = statement_periods(code, regions)
 
-    def find_phrase(s: str, phrase_re: re.Pattern, start: int = 0) -> int:
-        # Find phrase (compiled regex) outside strings/comments
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i) + 1
-                    continue
-                if c == '*':
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i) + 1
-                        continue
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-                m = phrase_re.search(s, i)
-                if not m:
-                    return -1
-                # verify the match is not broken by entering string/comment
-                # Since we step token-by-token above, if we found it, it's valid here.
-                return m.start()
-            else:
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            i += 2
-                            continue
-                        in_sq = False
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            i += 2
-                            continue
-                        in_bt = False
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            i += 2
-                            continue
-                        in_tpl = False
-                    i += 1
-                    continue
-        return -1
+    def in_code(pos: int) -> bool:
+        k = bisect_right(region_starts, pos) - 1
+        return k >= 0 and pos < regions[k][1]
 
-    def at_statement_lead(s: str, pos: int) -> bool:
-        # True if 'pos' is the first non-space/tab char of a statement line (ignoring leading spaces/tabs)
-        # and not inside commented line.
-        # Find line start
-        ls = s.rfind('\n', 0, pos)
-        ls = 0 if ls == -1 else ls + 1
-        # If this line starts with '*', it's a comment
-        k = ls
-        while k < pos and s[k] in (' ', '\t'):
-            k += 1
-        if k < len(s) and s[k] == '*':
-            return False
-        # Also ensure we are not after a period on same line (i.e., multiple statements per line)
-        # ABAP style is one statement per line; require 'pos' be the first token on the line
-        return k == pos
-
-    def normalize_spaces_preserve_newlines(text: str) -> str:
-        # Collapse runs of spaces/tabs but keep newlines as-is
-        def repl(m):
-            s = m.group(0)
-            return ' ' if '\n' not in s else s
-        return re.sub(r'[ \t]+', repl, text)
+    def find_kw(kw: str, start: int, end: int) -> int:
+        # Next occurrence of (lower-case) keyword in code[start:end] outside strings/comments
+        n = len(kw)
+        i = code_lower.find(kw, start, end)
+        while i != -1:
+            left_ok = (i == 0) or (not _is_word_char(code[i-1]))
+            right_ok = (i + n == end) or (not _is_word_char(code[i+n]))
+            if left_ok and right_ok and in_code(i):
+                return i
+            i = code_lower.find(kw, i + 1, end)
+        return -1
 
     # --- Field extraction from SELECT list ---------------------------
 
     # Combined robust extract: from after 'select' to the 'from'
-    def extract_select_list(stmt: str) -> str:
-        # stmt is the full SELECT statement without trailing period
-        sel_idx = find_kw(stmt, 'select', 0)
-        if sel_idx == -1:
-            return ''
+    def extract_select_list(sel_pos: int, end: int) -> str:
+        # code[sel_pos:end] is the full SELECT statement without trailing period
         # skip 'select'
-        i = sel_idx + 6
-        n = len(stmt)
+        i = sel_pos + 6
         # skip whitespace
-        while i < n and stmt[i].isspace():
-            i += 1
+        i = _SPACE_RUN_RE.match(code, i, end).end()
         # The 'from' delim
-        from_idx = find_kw(stmt, 'from', i)
+        from_idx = find_kw('from', i, end)
         if from_idx == -1:
             return ''
-        return stmt[i:from_idx].strip()
+        return code[i:from_idx].strip()
 
     def split_fields(field_segment: str) -> list[str]:
         """
@@ -288,161 +139,120 @@ def process_orderby(code: str) -> str:
         if s == '*' or s.lower().startswith('('):
             return ['*']
 
+        # The delimiter style decides which of the two item passes below runs
+        comma_sep = ',' in s
+
+        # Items are assembled from slices of 's'; only depth-0 whitespace runs
+        # are rewritten (collapsed to a single space).
         items = []
-        buf = []
+        parts = []
+        seg = 0
         depth = 0
         i = 0
         n = len(s)
-        in_sq = in_bt = in_tpl = False
         while i < n:
+            # jump straight to the next character that can end or split an item
+            m = _FIELD_STOP_RE.search(s, i)
+            if not m:
+                break
+            i = m.start()
             c = s[i]
             # string/template handling inside select list (rare but safe)
-            if not (in_sq or in_bt or in_tpl):
-                if c == "'":
-                    in_sq = True
-                    buf.append(c)
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    buf.append(c)
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    buf.append(c)
-                    i += 1
-                    continue
-
-                if c == '(':
-                    depth += 1
-                    buf.append(c)
-                    i += 1
-                    continue
-                if c == ')':
-                    depth = max(0, depth - 1)
-                    buf.append(c)
-                    i += 1
-                    continue
-
-                if depth == 0 and c == ',':
-                    # end of an item
-                    item = ''.join(buf).strip()
-                    if item:
-                        items.append(item)
-                    buf = []
-                    i += 1
-                    continue
-
-                # whitespace separates items if not using commas and outside parens
-                if depth == 0 and c.isspace():
-                    # collapse to single space inside item
-                    if buf and buf[-1] != ' ':
-                        buf.append(' ')
-                    i += 1
-                    continue
-
-                buf.append(c)
-                i += 1
+            if c == "'" or c == '`' or c == '|':
+                # keep the literal verbatim; a doubled delimiter is an escape
+                j = s.find(c, i + 1)
+                while j != -1 and j + 1 < n and s[j+1] == c:
+                    j = s.find(c, j + 2)
+                i = n if j == -1 else j + 1
                 continue
 
-            else:
-                # inside quoted text
-                if in_sq:
-                    buf.append(c)
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            buf.append(s[i+1])
-                            i += 2
-                            continue
-                        in_sq = False
-                    i += 1
-                    continue
-                if in_bt:
-                    buf.append(c)
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            buf.append(s[i+1])
-                            i += 2
-                            continue
-                        in_bt = False
-                    i += 1
-                    continue
-                if in_tpl:
-                    buf.append(c)
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            buf.append(s[i+1])
-                            i += 2
-                            continue
-                        in_tpl = False
-                    i += 1
-                    continue
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth = max(0, depth - 1)
+            elif depth == 0 and c == ',':
+                # end of an item
+                parts.append(s[seg:i])
+                item = ''.join(parts).strip()
+                if item:
+                    items.append(item)
+                parts = []
+                seg = i + 1
+            elif depth == 0 and c.isspace():
+                # whitespace separates items if not using commas and outside parens;
+                # collapse the whole run to a single space inside the item
+                parts.append(s[seg:i])
+                parts.append(' ')
+                i = _SPACE_RUN_RE.match(s, i).end()
+                seg = i
+                continue
+            i += 1
 
         # flush last
-        last = ''.join(buf).strip()
+        parts.append(s[seg:])
+        last = ''.join(parts).strip()
         if last:
             items.append(last)
 
-        # If no commas and items are space-split, ensure we split properly:
-        # items might still contain multiple items if commas absent and we kept single spaces
-        # We'll split by spaces but try to keep "AS alias" grouped.
-        final_items = []
-        for it in items:
-            # Split by spaces into tokens
-            toks = [t for t in it.strip().split(' ') if t]
-            if not toks:
-                continue
-            # Merge tokens into fields (whitespace-separated list)
-            k = 0
-            curr = []
-            while k < len(toks):
-                tok = toks[k]
-                if tok.lower() == 'as' and curr:
-                    # take alias (next token if any) as the field identifier
-                    if k + 1 < len(toks):
-                        # The alias becomes the defining field for ORDER BY
-                        final_items.append(toks[k+1])
-                        k += 2
-                        curr = []
-                        # any remaining tokens after alias start a new item
-                        continue
-                    else:
-                        # trailing AS without alias - ignore
-                        k += 1
-                        continue
-                elif tok.lower() in ('distinct',):
-                    k += 1
-                    continue
-                else:
-                    curr.append(tok)
-                    # Heuristic: ABAP usually uses explicit list; if next token is a table-field like a~b,
-                    # treat as separate item when curr already has one token
-                    if len(curr) >= 1 and k + 1 < len(toks):
-                        # peek: if next is a simple identifier-like token, we assume next item
-                        nxt = toks[k+1]
-                        # We'll close item here and continue
-                        final_items.append(' '.join(curr))
-                        curr = []
-                    k += 1
-            if curr:
-                final_items.append(' '.join(curr))
-
-        # If comma-separated, 'items' are already good; but they may contain "AS alias"
-        if ',' in field_segment:
+        # Comma-separated lists are complete once split; they may contain "AS alias"
+        if comma_sep:
             final_items = []
             for it in items:
                 # Detect " AS " outside parentheses
                 # Simple split on ' as ' ignoring case
-                m = re.search(r'(?i)\bas\b', it)
-                if m:
+                k = _find_as(it)
+                if k != -1:
                     # take alias (text after AS)
-                    alias = it[m.end():].strip()
+                    alias = it[k+2:].strip()
                     # If alias has trailing tokens, cut at first space
                     alias = alias.split()[0] if alias else ''
-                    final_items.append(alias if alias else it[:m.start()].strip())
+                    final_items.append(alias if alias else it[:k].strip())
                 else:
                     final_items.append(it.strip())
+        else:
+            # If no commas and items are space-split, ensure we split properly:
+            # items might still contain multiple items if commas absent and we kept single spaces
+            # We'll split by spaces but try to keep "AS alias" grouped.
+            final_items = []
+            for it in items:
+                # Split by spaces into tokens
+                toks = [t for t in it.strip().split(' ') if t]
+                if not toks:
+                    continue
+                # Merge tokens into fields (whitespace-separated list)
+                k = 0
+                curr = []
+                while k < len(toks):
+                    tok = toks[k]
+                    if tok.lower() == 'as' and curr:
+                        # take alias (next token if any) as the field identifier
+                        if k + 1 < len(toks):
+                            # The alias becomes the defining field for ORDER BY
+                            final_items.append(toks[k+1])
+                            k += 2
+                            curr = []
+                            # any remaining tokens after alias start a new item
+                            continue
+                        else:
+                            # trailing AS without alias - ignore
+                            k += 1
+                            continue
+                    elif tok.lower() in ('distinct',):
+                        k += 1
+                        continue
+                    else:
+                        curr.append(tok)
+                        # Heuristic: ABAP usually uses explicit list; if next token is a table-field like a~b,
+                        # treat as separate item when curr already has one token
+                        if len(curr) >= 1 and k + 1 < len(toks):
+                            # peek: if next is a simple identifier-like token, we assume next item
+                            nxt = toks[k+1]
+                            # We'll close item here and continue
+                            final_items.append(' '.join(curr))
+                            curr = []
+                        k += 1
+                if curr:
+                    final_items.append(' '.join(curr))
 
         # Clean up: remove empty and special keywords
         cleaned = []
@@ -459,141 +269,89 @@ def process_orderby(code: str) -> str:
 
     # --- Clause boundary helpers ------------------------------------
 
-    # For WHERE clause end, look for next clause keyword
-    WHERE_TERMINATORS = [
-        'group', 'having', 'order', 'into', 'appending', 'up', 'for', 'bypassing',
-        'union', 'intersect', 'except', 'client', 'using', 'package'
-    ]
-
-    def find_next_any_kw(s: str, keywords: list[str], start: int) -> tuple[int, str | None]:
-        best_idx = -1
-        best_kw = None
-        for kw in keywords:
-            idx = find_kw(s, kw, start)
-            if idx != -1 and (best_idx == -1 or idx < best_idx):
-                best_idx = idx
-                best_kw = kw
-        return best_idx, best_kw
+    def find_next_any_kw(start: int, end: int) -> tuple[int, str | None]:
+        # Earliest WHERE terminator in code[start:end] outside strings/comments
+        for m in _WHERE_TERM_RE.finditer(code_lower, start, end):
+            if in_code(m.start()):
+                return m.start(), m.group(1)
+        return -1, None
 
     # --- Decision helpers --------------------------------------------
 
-    fae_re = re.compile(r'(?i)\bfor\s+all\s+entries\b')
-    order_by_re = re.compile(r'(?i)\border\s+by\b')
+    # One pass over the source records where each clause keyword occurs;
+    # per statement the questions below become bisects over those positions.
+    # FOR ALL ENTRIES / ORDER BY count anywhere in the statement (comments included),
+    # as process_sort does, so both stages make the same skip decision.
+    # WHERE must be in code; hits arrive in source order, so the enclosing
+    # code slab is tracked by walking forward.
+    clause_pos = {'fae': [], 'order': [], 'where': []}
+    r = 0
+    n_regions = len(regions)
+    for m in _CLAUSE_RE.finditer(code_lower):
+        pos = m.start()
+        kind = m.lastgroup
+        if kind != 'where':
+            clause_pos[kind].append(pos)
+            continue
+        while r < n_regions and regions[r][1] <= pos:
+            r += 1
+        if r < n_regions and regions[r][0] <= pos:
+            clause_pos[kind].append(pos)
 
-    def has_for_all_entries(stmt: str) -> bool:
-        return find_phrase(stmt, fae_re, 0) != -1
+    def first_clause(kind: str, start: int, end: int) -> int:
+        positions = clause_pos[kind]
+        k = bisect_left(positions, start)
+        return positions[k] if k < len(positions) and positions[k] < end else -1
 
-    def has_order_by(stmt: str) -> bool:
-        return find_phrase(stmt, order_by_re, 0) != -1
+    def has_for_all_entries(start: int, end: int) -> bool:
+        return first_clause('fae', start, end) != -1
 
-    # --- Main processing loop ----------------------------------------
+    def has_order_by(start: int, end: int) -> bool:
+        return first_clause('order', start, end) != -1
 
-    out = []
-    i = 0
-    n = len(code)
-
-    while i < n:
-        # scan for next top-level 'select' that is at statement lead
-        scan = i
-        in_sq = in_bt = in_tpl = False
-        sel_pos = -1
-
-        while scan < n:
-            c = code[scan]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    scan = skip_line_comment(code, scan)
-                    if scan < n:
-                        scan += 1
-                    continue
-                if c == '*':
-                    if scan == 0 or code[scan-1] == '\n':
-                        scan = skip_full_line_star_comment(code, scan)
-                        if scan < n:
-                            scan += 1
-                        continue
-                if c == "'":
-                    in_sq = True
-                    scan += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    scan += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    scan += 1
-                    continue
-                if code[scan:scan+6].lower() == 'select' and (scan+6 == n or not is_word_char(code[scan+6])) and at_statement_lead(code, scan):
-                    sel_pos = scan
-                    break
-                scan += 1
-                continue
-            else:
-                if in_sq:
-                    if c == "'":
-                        if scan + 1 < n and code[scan+1] == "'":
-                            scan += 2
-                            continue
-                        in_sq = False
-                    scan += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if scan + 1 < n and code[scan+1] == '`':
-                            scan += 2
-                            continue
-                        in_bt = False
-                    scan += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if scan + 1 < n and code[scan+1] == '|':
-                            scan += 2
-                            continue
-                        in_tpl = False
-                    scan += 1
-                    continue
+    # --- Main processing loop ----------------------------------------
 
-        if sel_pos == -1:
-            out.append(code[i:])
-            break
+    # Source text is only copied out when an ORDER BY is inserted; everything from
+    # 'last' on is still pending and is written in one piece at the end.
+    buf = io.StringIO()
+    last = 0
+    resume = 0
 
-        # Append text before SELECT as-is
-        out.append(code[i:sel_pos])
+    # Candidate SELECTs come from one regex sweep; those inside comments/strings are rejected.
+    for m in _SELECT_LEAD_RE.finditer(code_lower):
+        sel_pos = m.start('kw')
+        if sel_pos < resume or not in_code(sel_pos):
+            continue
 
         # Find terminating period for this statement
-        period = find_statement_period(code, sel_pos)
-        if period == -1:
-            # malformed; append rest and stop
-            out.append(code[sel_pos:])
+        k = bisect_left(periods, sel_pos)
+        if k == len(periods):
+            # malformed; leave the rest untouched
             break
-
-        stmt = code[sel_pos:period]  # without '.'
+        period = periods[k]
+        resume = period + 1
 
         # Check skip conditions
-        if has_for_all_entries(stmt) or has_order_by(stmt):
+        if has_for_all_entries(sel_pos, period) or has_order_by(sel_pos, period):
             # No change
-            out.append(code[sel_pos:period+1])
-            i = period + 1
             continue
 
-        # Extract indent (for PWC tag)
-        line_start = code.rfind('\n', 0, sel_pos)
-        line_start = 0 if line_start == -1 else line_start + 1
-        indent = ''
-        k = line_start
-        while k < sel_pos and code[k] in (' ', '\t'):
-            indent += code[k]
-            k += 1
+        # Indent (for PWC tag): the lead match starts at the line start and only
+        # spans blanks/tabs up to SELECT
+        line_start = m.start()
 
         # Build ORDER BY list
-        select_list = extract_select_list(stmt)
-        fields = split_fields(select_list)
+        select_list = extract_select_list(sel_pos, period)
 
+        # SELECT * and dynamic "(...)" lists always order by primary key; no need
+        # to split them into fields first
         use_primary_key = False
-        if not fields or fields == ['*'] or any(f.strip() == '*' for f in fields):
+        if not select_list or select_list == '*' or select_list[0] == '(':
             use_primary_key = True
+        else:
+            fields = split_fields(select_list)
+            if not fields or fields == ['*'] or any(f.strip() == '*' for f in fields):
+                use_primary_key = True
 
         if use_primary_key:
             orderby_clause = ' ORDER BY PRIMARY KEY'
@@ -608,14 +366,14 @@ def process_orderby(code: str) -> str:
                 if t.endswith(','):
                     t = t[:-1].strip()
                 # If token contains ' AS ' pick alias (already handled but safe)
-                m = re.search(r'(?i)\bas\b', t)
-                if m:
-                    alias = t[m.end():].strip().split()[0] if t[m.end():].strip() else ''
-                    t = alias if alias else t[:m.start()].strip()
+                k = _find_as(t)
+                if k != -1:
+                    alias = t[k+2:].strip().split()[0] if t[k+2:].strip() else ''
+                    t = alias if alias else t[:k].strip()
                 # Remove parentheses around bare identifiers e.g., (col) -> col
                 if t.startswith('(') and t.endswith(')'):
                     inner = t[1:-1].strip()
-                    if re.match(r'^[A-Za-z_]\w*(~[A-Za-z_]\w*)?$', inner):
+                    if _BARE_IDENT_RE.match(inner):
                         t = inner
                 cleaned.append(t)
             # Deduplicate while preserving order
@@ -629,31 +387,37 @@ def process_orderby(code: str) -> str:
             orderby_clause = ' ORDER BY ' + ', '.join(ordered if ordered else ['PRIMARY KEY'])
 
         # Decide insertion point: after WHERE clause if present, else before period
-        where_idx = find_kw(stmt, 'where', 0)
-        insert_pos_in_stmt = None
+        where_idx = first_clause('where', sel_pos, period)
+        insert_pos = period
         if where_idx != -1:
             # End of WHERE clause is at next terminator or end of stmt
             search_start = where_idx + 5
-            end_idx, _ = find_next_any_kw(stmt, WHERE_TERMINATORS, search_start)
-            insert_pos_in_stmt = end_idx if end_idx != -1 else len(stmt)
-        else:
-            insert_pos_in_stmt = len(stmt)
-
-        # Construct new statement
-        left = stmt[:insert_pos_in_stmt].rstrip()
-        right = stmt[insert_pos_in_stmt:].lstrip()
-        new_stmt = f"{left}{orderby_clause}"
-        if right:
-            new_stmt = f"{new_stmt} {right}"
-
-        new_stmt = normalize_spaces_preserve_newlines(new_stmt).strip()
-
-        # Build replacement text with PwC tag
-        replacement = indent + pwc_tag_line + new_stmt + '.'
-
-        out.append(replacement)
-
-        # Advance
-        i = period + 1
-
-    return ''.join(out)
\ No newline at end of file
+            end_idx, _ = find_next_any_kw(search_start, period)
+            if end_idx != -1:
+                insert_pos = end_idx
+
+        # Construct new statement as spans of the source: whitespace around the
+        # insertion point is trimmed, the rest of the statement keeps its layout.
+        left_end = insert_pos
+        while left_end > sel_pos and code[left_end - 1].isspace():
+            left_end -= 1
+        right_start = insert_pos
+        while right_start < period and code[right_start].isspace():
+            right_start += 1
+
+        buf.write(code[last:sel_pos])
+        buf.write(code[line_start:sel_pos])
+        buf.write(pwc_tag_line)
+        buf.write(code[sel_pos:left_end])
+        buf.write(orderby_clause)
+        if right_start < period:
+            buf.write(' ')
+            buf.write(code[right_start:period])
+        buf.write('.')
+        last = period + 1
+
+    if not buf.tell():
+        # No ORDER BY inserted: return the source object itself instead of a copy
+        return code
+    buf.write(code[last:])
+    return buf.getvalue()
\ No newline at end of file
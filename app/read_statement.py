@@ -1,7 +1,38 @@
 # app/read_statment.py
 
+import io
 import re
+import string
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Executor
 from datetime import date
+from itertools import accumulate
+
+from app.common import make_pwc_tag_line, map_in_processes
+from app.lex import code_regions, statement_periods
+
+# READ TABLE keyword pair; only searched inside code slabs
+_RE_READ_TABLE = re.compile(r'\bread[ \t\r\n]+table\b', re.I)
+# READ TABLE ... itab ...
+_RE_ITAB = re.compile(r'\bread\s+table\s+(?P<itab><[A-Za-z_]\w*>|[A-Za-z_]\w*)\b', re.I | re.S)
+_RE_INDEX = re.compile(r'\bindex\b', re.I | re.S)
+# INDEX or any KEY phrase, whichever comes first
+_RE_INDEX_OR_KEY = re.compile(
+    r'\b(?:(?P<index>index)|with\s+table\s+key|with\s+key|table\s+key|key)\b', re.I | re.S
+)
+# Also the KEY anchor: the longest phrase wins at the first KEY position
+_RE_KEY = re.compile(r'\b(?:with\s+table\s+key|with\s+key|table\s+key|key)\b', re.I | re.S)
+_RE_COMPONENTS = re.compile(r'\bcomponents\b', re.I | re.S)
+# Identifier immediately before '='
+_RE_FIELD_LHS = re.compile(r'\b([A-Za-z_]\w*)\s*=', re.I | re.S)
+# Keyword tokens that can sit before '=' but are never key fields
+_KEY_STOPWORDS = frozenset({'with', 'table', 'key', 'components'})
+# Characters that can start a (non field-symbol) itab name
+_IDENT_START = frozenset(string.ascii_letters + '_')
+# Runs skipped with match(pos, endpos) instead of per-character loops
+_RE_BLANKS = re.compile(r'[ \t]*')
+_RE_SPACES = re.compile(r'\s*')
+_RE_WORD_TAIL = re.compile(r'\w*')
 
 def process_read(code: str) -> str:
     """
@@ -32,112 +63,43 @@ def process_read(code: str) -> str:
     Returns modified source as a single string.
     """
 
-    pwc_tag_line = f'" Added By Pwc {date.today().isoformat()}\n'
+    # Nothing to remediate without READ TABLE anywhere in the text; skip lexing
+    if not _RE_READ_TABLE.search(code):
+        return code
+
+    pwc_tag_line = make_pwc_tag_line(date.today())
 
     # ----------------- Lexical utilities -----------------
 
-    def is_word_char(c: str) -> bool:
-        return c.isalnum() or c == '_'
+    # Start offset of every line, built on first use (only sources with a READ
+    # TABLE need it); line lookups are a bisect instead of a backwards scan
+    line_starts = None
 
-    def match_kw_at(s: str, i: int, kw: str) -> bool:
-        n = len(kw)
-        if i < 0 or i + n > len(s):
-            return False
-        if s[i:i+n].lower() != kw.lower():
-            return False
-        left_ok = (i == 0) or (not is_word_char(s[i-1]))
-        right_ok = (i + n == len(s)) or (not is_word_char(s[i+n]))
-        return left_ok and right_ok
-
-    def skip_line_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '"'
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def skip_full_line_star_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '*' at BOL
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def find_statement_period(s: str, start: int) -> int:
-        # Returns index of '.' that terminates the ABAP statement starting at 'start'
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i)
-                    continue
-                if c == '*':
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i)
-                        continue
-                if c == "'":
-                    in_sq = True; i += 1; continue
-                if c == '`':
-                    in_bt = True; i += 1; continue
-                if c == '|':
-                    in_tpl = True; i += 1; continue
-                if c == '.':
-                    return i
-                i += 1
-            else:
-                # inside string/template
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            i += 2; continue
-                        in_sq = False
-                    i += 1; continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            i += 2; continue
-                        in_bt = False
-                    i += 1; continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            i += 2; continue
-                        in_tpl = False
-                    i += 1; continue
-        return -1
+    def line_index(pos: int, lo: int = 0) -> int:
+        # Line containing 'pos'; 'lo' is a line known to start at or before it
+        nonlocal line_starts
+        if line_starts is None:
+            line_starts = list(accumulate((len(line) + 1 for line in code.split('\n')[:-1]), initial=0))
+        return bisect_right(line_starts, pos, lo) - 1
 
-    def get_line_indent_before(pos: int) -> str:
-        # Indentation of the line containing position 'pos'
-        ls = code.rfind('\n', 0, pos)
-        ls = 0 if ls == -1 else ls + 1
-        k = ls
-        indent = []
-        while k < pos and code[k] in (' ', '\t'):
-            indent.append(code[k]); k += 1
-        return ''.join(indent)
-
-    def prev_executable_line_start(s: str, pos: int) -> int:
+    def get_line_indent_before(pos: int, li: int) -> str:
+        # Indentation of line 'li', which contains position 'pos'
+        ls = line_starts[li]
+        return code[ls:_RE_BLANKS.match(code, ls, pos).end()]
+
+    def prev_executable_line_start(s: str, pos: int, li: int) -> int:
         # Return the index of the first non-space char of the previous non-empty, non-comment line before 'pos'
+        # ('li' is the line containing 'pos')
         i = pos
         while i > 0:
-            # move to start of current/previous line
-            nl = s.rfind('\n', 0, i)
-            if nl == -1:
-                ls = 0
-            else:
-                ls = nl + 1
+            # start of current/previous line
+            ls = line_starts[li]
             # trim leading spaces/tabs
-            k = ls
-            while k < i and s[k] in (' ', '\t'):
-                k += 1
+            k = _RE_BLANKS.match(s, ls, i).end()
             # If line is empty or comment-only, move further up
-            if k >= i or (k < len(s) and s[k] in ('\n', '\r')):
-                i = ls - 1 if ls > 0 else 0
-                continue
-            if s[k] == '*':
-                i = ls - 1 if ls > 0 else 0
-                continue
-            if s[k] == '"':
+            if k >= i or s[k] in ('\n', '\r', '*', '"'):
                 i = ls - 1 if ls > 0 else 0
+                li -= 1
                 continue
             # Found a previous executable line's first non-space index
             return k
@@ -145,58 +107,23 @@ def process_read(code: str) -> str:
 
     # ----------------- READ statement analysis -----------------
 
-    # READ TABLE ... itab ...
-    itab_re = re.compile(r'(?is)\bread\s+table\s+(?P<itab><[A-Za-z_]\w*>|[A-Za-z_]\w*)\b')
-
-    # Determine if READ uses INDEX
-    def read_has_index(stmt: str) -> bool:
-        return re.search(r'(?is)\bindex\b', stmt) is not None
-
-    # Determine if READ uses KEY / WITH KEY / WITH TABLE KEY
-    def read_has_key(stmt: str) -> bool:
-        return re.search(r'(?is)\b(?:with\s+table\s+key|with\s+key|table\s+key|key)\b', stmt) is not None
-
-    # Extract internal table identifier/field-symbol from READ statement
-    def extract_itab(stmt: str) -> str | None:
-        m = itab_re.search(stmt)
-        return m.group('itab') if m else None
-
     # Extract list of key field names to be used for SORT BY, based on the READ KEY clause.
     # Strategy:
-    #   1) Locate KEY anchor:
-    #        - prefer "COMPONENTS" part if present; else part right after "WITH TABLE KEY" / "WITH KEY" / "KEY"
+    #   1) 'key_start' is the end of the KEY anchor ("WITH TABLE KEY" / "WITH KEY" / "KEY");
+    #      prefer the "COMPONENTS" part if present.
     #   2) From that anchor to the end of the statement, collect all identifiers immediately before '='.
     #   3) Deduplicate preserving order; ignore obviously non-field tokens.
     #   4) If nothing extracted (dynamic components etc.), return [].
-    def extract_key_fields(stmt: str) -> list[str]:
-        lower = stmt.lower()
-
-        # Find the first relevant KEY phrase after "read table <itab>"
-        m_itab = itab_re.search(stmt)
-        search_from = m_itab.end() if m_itab else 0
-
-        # Look for 'with table key', 'with key', or bare 'key'
-        m_key = (re.search(r'(?is)\bwith\s+table\s+key\b', stmt[search_from:]) or
-                 re.search(r'(?is)\bwith\s+key\b', stmt[search_from:]) or
-                 re.search(r'(?is)\btable\s+key\b', stmt[search_from:]) or
-                 re.search(r'(?is)\bkey\b', stmt[search_from:]))
-
-        if not m_key:
-            return []
-
-        key_start = search_from + m_key.end()
-
+    def extract_key_fields(stmt: str, key_start: int) -> list[str]:
         # If 'COMPONENTS' follows, anchor after it
-        m_comp = re.search(r'(?is)\bcomponents\b', stmt[key_start:])
+        m_comp = _RE_COMPONENTS.search(stmt, key_start)
         if m_comp:
-            key_start = key_start + m_comp.end()
-
-        # Substring containing assignments like f1 = ..., f2 = ...
-        key_section = stmt[key_start:]
+            key_start = m_comp.end()
 
-        # Collect identifiers immediately before '='
+        # Collect identifiers immediately before '=' in the assignments that follow
+        # (f1 = ..., f2 = ...)
         # Accept identifiers of the form: name (letters/digits/_), and also 'table_line'
-        candidates = re.findall(r'(?is)\b([A-Za-z_]\w*)\s*=', key_section)
+        candidates = _RE_FIELD_LHS.findall(stmt, key_start)
 
         # Deduplicate preserving order
         fields = []
@@ -204,7 +131,7 @@ def process_read(code: str) -> str:
         for f in candidates:
             fl = f.lower()
             # Filter out obvious non-fields if any
-            if fl in ('with', 'table', 'key', 'components'):
+            if fl in _KEY_STOPWORDS:
                 continue
             if fl not in seen:
                 seen.add(fl)
@@ -212,146 +139,118 @@ def process_read(code: str) -> str:
 
         return fields
 
+    # Analyse a READ statement, sharing one keyword search between the INDEX/KEY
+    # decision and the KEY anchor. Returns (itab, kind, fields):
+    #   itab   - internal table identifier/field-symbol, or None
+    #   kind   - 'index' (INDEX wins when both occur), 'key' (KEY / WITH KEY /
+    #            WITH TABLE KEY) or None
+    #   fields - SORT BY fields for KEY reads (see extract_key_fields)
+    def analyze_read(stmt: str) -> tuple[str | None, str | None, list[str]]:
+        m_itab = _RE_ITAB.search(stmt)
+        if not m_itab:
+            return None, None, []
+        itab = m_itab.group('itab')
+
+        m = _RE_INDEX_OR_KEY.search(stmt)
+        if not m:
+            return itab, None, []
+        if m.lastgroup == 'index' or _RE_INDEX.search(stmt, m.end()):
+            return itab, 'index', []
+
+        # m is the first KEY phrase; it is also the anchor unless it lies inside
+        # "read table <itab>" itself (e.g. an itab called KEY)
+        m_key = m if m.start() >= m_itab.end() else _RE_KEY.search(stmt, m_itab.end())
+        return itab, 'key', extract_key_fields(stmt, m_key.end()) if m_key else []
+
     # Check if the immediately previous executable line starts with "SORT <itab>"
-    def is_sort_immediately_before(s: str, read_pos: int, itab: str) -> bool:
-        prev_start = prev_executable_line_start(s, read_pos)
+    def is_sort_immediately_before(s: str, read_pos: int, read_line: int, itab: str) -> bool:
+        prev_start = prev_executable_line_start(s, read_pos, read_line)
         if prev_start == -1:
             return False
         line_end = s.find('\n', prev_start)
-        line = s[prev_start:] if line_end == -1 else s[prev_start:line_end]
-        # Remove inline comment if any
-        q = line.find('"')
+        if line_end == -1:
+            line_end = len(s)
+        # Ignore inline comment if any
+        q = s.find('"', prev_start, line_end)
         if q != -1:
-            line = line[:q]
-        line = line.strip()
-        # Match SORT for same itab (supports field-symbols like <fs>)
-        m = re.match(r'(?is)^sort\s+(<\w+>|[A-Za-z_]\w*)\b', line)
-        if not m:
+            line_end = q
+        # Match SORT for same itab (supports field-symbols like <fs>); the line
+        # already starts at its first non-blank character
+        k = prev_start + 4
+        if k >= line_end or s[prev_start:k].lower() != 'sort' or not s[k].isspace():
+            return False
+        k = _RE_SPACES.match(s, k, line_end).end()
+        if k == line_end:
+            return False
+        if s[k] == '<':
+            end = s.find('>', k, line_end) + 1
+            if end == 0:
+                return False
+        elif s[k] in _IDENT_START:
+            end = _RE_WORD_TAIL.match(s, k + 1, line_end).end()
+        else:
             return False
-        return m.group(1).lower() == itab.lower()
+        return s[k:end].lower() == itab.lower()
 
     # ----------------- Main processing loop -----------------
 
-    out_parts = []
+    # The source is lexed once: READ TABLE is only searched for in code slabs,
+    # and statement ends come from the precomputed period offsets
+    regions = code_regions(code)
+    periods = statement_periods(code, regions)
+
+    # Source text is only copied out when a SORT is inserted; everything from
+    # 'last' on is still pending and is written in one piece at the end.
+    buf = io.StringIO()
+    last = 0
     i = 0
-    n = len(code)
-
-    while i < n:
-        # Scan for next top-level "read table" outside strings/comments
-        scan = i
-        in_sq = in_bt = in_tpl = False
-        read_pos = -1
-
-        while scan < n:
-            c = code[scan]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    scan = skip_line_comment(code, scan)
-                    if scan < n:
-                        scan += 1
-                    continue
-                if c == '*':
-                    if scan == 0 or code[scan-1] == '\n':
-                        scan = skip_full_line_star_comment(code, scan)
-                        if scan < n:
-                            scan += 1
-                        continue
-                if c == "'":
-                    in_sq = True; scan += 1; continue
-                if c == '`':
-                    in_bt = True; scan += 1; continue
-                if c == '|':
-                    in_tpl = True; scan += 1; continue
-                # Possible READ TABLE
-                if match_kw_at(code, scan, 'read'):
-                    # after 'read', ensure next keyword 'table'
-                    j = scan + 4
-                    # skip spaces/tabs/newlines
-                    while j < n and code[j] in (' ', '\t', '\r', '\n'):
-                        j += 1
-                    if match_kw_at(code, j, 'table'):
-                        read_pos = scan
-                        break
-                scan += 1
-            else:
-                # inside string/template
-                if in_sq:
-                    if c == "'":
-                        if scan + 1 < n and code[scan+1] == "'":
-                            scan += 2; continue
-                        in_sq = False
-                    scan += 1; continue
-                if in_bt:
-                    if c == '`':
-                        if scan + 1 < n and code[scan+1] == '`':
-                            scan += 2; continue
-                        in_bt = False
-                    scan += 1; continue
-                if in_tpl:
-                    if c == '|':
-                        if scan + 1 < n and code[scan+1] == '|':
-                            scan += 2; continue
-                        in_tpl = False
-                    scan += 1; continue
-
-        if read_pos == -1:
-            out_parts.append(code[i:])
-            break
+    read_line = 0
 
-        # Append everything before this READ as-is
-        out_parts.append(code[i:read_pos])
+    for read_pos in [m.start() for a, b in regions for m in _RE_READ_TABLE.finditer(code, a, b)]:
+        # Skip READ TABLE text inside the previous READ statement
+        if read_pos < i:
+            continue
 
         # Determine end of READ statement (the '.' terminator)
-        period_pos = find_statement_period(code, read_pos)
-        if period_pos == -1:
+        k = bisect_left(periods, read_pos)
+        if k == len(periods):
             # Malformed or unterminated; leave rest untouched
-            out_parts.append(code[read_pos:])
             break
+        period_pos = periods[k]
 
         # Extract the full READ statement text (without '.')
         read_stmt = code[read_pos:period_pos]
-        itab = extract_itab(read_stmt)
+        itab, kind, fields = analyze_read(read_stmt)
 
         # If cannot determine the itab, do not modify
         if not itab:
-            out_parts.append(code[read_pos:period_pos + 1])
             i = period_pos + 1
             continue
 
-        # Determine if READ uses INDEX or KEY
-        has_index = read_has_index(read_stmt)
-        has_key = read_has_key(read_stmt)
-
         # If neither INDEX nor KEY variants matched, skip
-        if not (has_index or has_key):
-            out_parts.append(code[read_pos:period_pos + 1])
+        if kind is None:
             i = period_pos + 1
             continue
 
+        # Line of this READ, looked up once for the SORT check and the indent.
+        # READs come in source order, so the search starts at the previous READ's line.
+        read_line = line_index(read_pos, read_line)
+
         # If there's already a SORT <itab> immediately before this READ, do not insert another
-        if is_sort_immediately_before(code, read_pos, itab):
-            out_parts.append(code[read_pos:period_pos + 1])
+        if is_sort_immediately_before(code, read_pos, read_line, itab):
             i = period_pos + 1
             continue
 
         # Build SORT statement based on variant
-        indent = get_line_indent_before(read_pos)
+        indent = get_line_indent_before(read_pos, read_line)
 
-        if has_index:
+        if kind == 'index':
             sort_stmt = f"{indent}SORT {itab}."
         else:
-            # KEY variant: extract fields
-            fields = extract_key_fields(read_stmt)
+            # KEY variant: fields were extracted with the analysis
             if fields:
-                # ABAP SORT BY uses space-separated fields
-                fields_unique = []
-                seen = set()
-                for f in fields:
-                    fl = f.lower()
-                    if fl not in seen:
-                        seen.add(fl)
-                        fields_unique.append(f)
-                sort_stmt = f"{indent}SORT {itab} BY " + ' '.join(fields_unique) + '.'
+                # ABAP SORT BY uses space-separated fields (already deduplicated)
+                sort_stmt = f"{indent}SORT {itab} BY " + ' '.join(fields) + '.'
             else:
                 # Fallback if no fields resolvable (dynamic key etc.)
                 sort_stmt = f"{indent}SORT {itab}."
@@ -359,11 +258,25 @@ def process_read(code: str) -> str:
         # Insert SORT before READ with PwC tag after the SORT period
         insertion = sort_stmt + "\n" + indent + pwc_tag_line
 
-        out_parts.append(insertion)
-        # Append the original READ statement and its terminating period
-        out_parts.append(code[read_pos:period_pos + 1])
+        # Flush everything before this READ as-is, then the insertion; the READ
+        # statement itself stays pending
+        buf.write(code[last:read_pos])
+        buf.write(insertion)
+        last = read_pos
 
         # Advance past the READ statement
         i = period_pos + 1
 
-    return ''.join(out_parts)
\ No newline at end of file
+    if not buf.tell():
+        # No SORT inserted: return the source object itself instead of a copy
+        return code
+    buf.write(code[last:])
+    return buf.getvalue()
+
+def process_read_many(codes: list[str], executor: Executor | None = None) -> list[str]:
+    """
+    Apply process_read to several sources, sharded across worker processes
+    (see map_in_processes; pass executor to reuse an existing pool).
+    Results keep the input order.
+    """
+    return map_in_processes(process_read, codes, executor)
\ No newline at end of file
@@ -1,7 +1,53 @@
 # app/select.py
 
+import io
 import re
+import string
+from bisect import bisect_left, bisect_right
 from datetime import date
+from itertools import accumulate
+
+from app.common import make_pwc_tag_line
+from app.lex import code_regions, statement_periods
+
+# SELECT whose next token is SINGLE (blanks and comments in between are allowed).
+# Searched in the ASCII-lowercased source, so no case folding is needed (IGNORECASE
+# would also fold look-alikes such as 'ſelect' onto SELECT); hits outside the code
+# slabs of app.lex are dropped
+_SELECT_SINGLE_RE = re.compile(
+    r'select(?!\w)(?=(?:[ \t\r\n]|"[^\n]*(?:\n|\Z)|^\*[^\n]*(?:\n|\Z))*single(?!\w))',
+    re.MULTILINE,
+)
+# Byte-pattern twin, used on ASCII sources (offsets are identical)
+_SELECT_SINGLE_RE_B = re.compile(_SELECT_SINGLE_RE.pattern.encode('ascii'), re.MULTILINE)
+# Blanks and comments following a statement
+_SKIP_WS_COMMENTS_RE = re.compile(r'(?:[ \t\r\n]+|^\*[^\n]*|"[^\n]*)*', re.MULTILINE)
+_SPACES_RE = re.compile(r'\s*')
+# Leading blanks of a line
+_INDENT_RE = re.compile(r'[ \t]*')
+# Statement rewriting patterns
+_SINGLE_WORD_RE = re.compile(r'\bSINGLE\b', re.IGNORECASE)
+# SINGLE and any "UP TO n ROWS" removed in one substitution pass
+_SINGLE_UP_TO_ROWS_RE = re.compile(r'\bSINGLE\b|\bUP\s+TO\s+\d+\s+ROWS\b', re.IGNORECASE)
+# Runs of two or more spaces; runs that touch a tab are kept as they are
+_MULTI_SPACE_RE = re.compile(r'(?<![ \t]) {2,}(?![ \t])')
+# Keywords that can validly follow the INTO target; when encountered, INTO clause ends.
+# We purposely include: FROM, WHERE, ORDER, GROUP, HAVING, BYPASSING, CLIENT, USING,
+# FOR (UPDATE), APPENDING, UNION, INTERSECT, EXCEPT, PACKAGE, UP (TO). Searched in the
+# lowercased statement, like _WHERE_INTO_RE
+_INTO_TERMINATOR_RE = re.compile(
+    r'\b(?:from|where|order|group|having|bypassing|client|using|for'
+    r'|appending|union|intersect|except|package|up)\b'
+)
+# WHERE / INTO in the lowercased statement
+_WHERE_INTO_RE = re.compile(r'\b(?:where|into)\b')
+# Comments (" inline, * in column 1), blanked out before keyword lookups
+_COMMENT_RE = re.compile(r'"[^\n]*|^\*[^\n]*', re.MULTILINE)
+# ASCII-only lowercasing keeps offsets aligned with the original source
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _blank(m: re.Match) -> str:
+    return ' ' * (m.end() - m.start())
 
 def process_select(code: str) -> str:
     """
@@ -20,372 +66,125 @@ def process_select(code: str) -> str:
       5. Avoid changing commented or string-literal content.
     """
 
-    pwc_tag_line = f'" Added By Pwc {date.today().isoformat()}\n'
-
-    # Character classes used for "word boundary" checks
-    def is_word_char(c: str) -> bool:
-        return c.isalnum() or c == '_'
-
-    # Case-insensitive match of a whole keyword at position i, with word boundaries.
-    def match_kw_at(s: str, i: int, kw: str) -> bool:
-        n = len(kw)
-        if i < 0 or i + n > len(s):
-            return False
-        if s[i:i+n].lower() != kw.lower():
-            return False
-        left_ok = (i == 0) or (not is_word_char(s[i-1]))
-        right_ok = (i + n == len(s)) or (not is_word_char(s[i+n]))
-        return left_ok and right_ok
+    pwc_tag_line = make_pwc_tag_line(date.today())
+    # Lowercased once (ASCII only, so offsets stay aligned with code); cheap substring
+    # gates and the scanners use it
+    code_low = code.lower() if code.isascii() else code.translate(_ASCII_LOWER)
+    if 'select' not in code_low:
+        return code
+
+    # The SELECT SINGLE search only reports offsets, so it runs over the lowercased
+    # copy; ASCII sources (nearly all ABAP) are searched as bytes, which the re engine
+    # walks faster than str
+    if code.isascii():
+        scan_src = code_low.encode('ascii')
+        select_re = _SELECT_SINGLE_RE_B
+    else:
+        scan_src = code_low
+        select_re = _SELECT_SINGLE_RE
+
+    first = select_re.search(scan_src)
+    if first is None:
+        # no SELECT SINGLE anywhere, not even in comments: nothing to lex
+        return code
+
+    # The source is lexed once into code slabs (shared with the other stages);
+    # statement ends are the precomputed periods
+    regions = code_regions(code)
+    region_starts = [a for a, _ in regions]
+    periods = statement_periods(code, regions)
+
+    def in_code(pos: int) -> bool:
+        k = bisect_right(region_starts, pos) - 1
+        return k >= 0 and pos < regions[k][1]
 
     # Skip whitespace and line-comments starting with " and full-line comments starting with * in col 1.
     def skip_ws_and_comments(s: str, i: int) -> int:
-        length = len(s)
-        while i < length:
-            # Skip whitespace
-            while i < length and s[i] in (' ', '\t', '\r', '\n'):
-                i += 1
-            if i >= length:
-                return i
-            # Full-line '*' comment (only if at start of a line)
-            if s[i] == '*':
-                # Only if at start of line
-                j = i - 1
-                at_bol = (i == 0) or (s[j] == '\n')
-                if at_bol:
-                    # consume until next newline
-                    while i < length and s[i] != '\n':
-                        i += 1
-                    continue
-            # Inline comment starts with double quote " (outside strings)
-            if s[i] == '"':
-                # consume until EOL
-                while i < length and s[i] != '\n':
-                    i += 1
-                continue
-            break
-        return i
-
-    # Find the end index (position of '.') that terminates an ABAP statement starting at 'start'
-    # while respecting strings (single quotes '...', backticks `...`, string templates |...|)
-    # and ignoring periods inside strings or comments.
-    def find_statement_period(s: str, start: int) -> int:
-        i = start
-        length = len(s)
-        in_sq = False   # '...'
-        in_bt = False   # `...`
-        in_tpl = False  # |...|
-        while i < length:
-            c = s[i]
-            # Handle line comments if not in string/template
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    # skip to end of line
-                    while i < length and s[i] != '\n':
-                        i += 1
-                    continue
-                # full-line '*' comment only if at BOL
-                if c == '*':
-                    j = i - 1
-                    if i == 0 or s[j] == '\n':
-                        # skip to end of line
-                        while i < length and s[i] != '\n':
-                            i += 1
-                        continue
-            # Enter/exit string states
-            if not (in_sq or in_bt or in_tpl):
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-            else:
-                if in_sq:
-                    if c == "'":
-                        # doubled '' inside string -> escape
-                        if i + 1 < length and s[i+1] == "'":
-                            i += 2
-                            continue
-                        in_sq = False
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < length and s[i+1] == '`':
-                            i += 2
-                            continue
-                        in_bt = False
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < length and s[i+1] == '|':
-                            i += 2
-                            continue
-                        in_tpl = False
-                    i += 1
-                    continue
-            # Check for period terminator
-            if c == '.':
-                return i
-            i += 1
-        return -1
-
-    # Find first occurrence (index) of a keyword outside strings/comments with word boundaries
-    def find_kw(s: str, kw: str, start: int = 0) -> int:
-        i = start
-        length = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < length:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    # skip to EOL
-                    while i < length and s[i] != '\n':
-                        i += 1
-                    i += 1
-                    continue
-                if c == '*':
-                    j = i - 1
-                    if i == 0 or s[j] == '\n':
-                        while i < length and s[i] != '\n':
-                            i += 1
-                        i += 1
-                        continue
-                # possible match
-                if match_kw_at(s, i, kw):
-                    return i
-                # fast-skip if current char cannot start keyword
-                i += 1
-                continue
-            # inside string/template
-            if in_sq:
-                if c == "'":
-                    if i + 1 < length and s[i+1] == "'":
-                        i += 2
-                        continue
-                    in_sq = False
-                i += 1
-                continue
-            if in_bt:
-                if c == '`':
-                    if i + 1 < length and s[i+1] == '`':
-                        i += 2
-                        continue
-                    in_bt = False
-                i += 1
-                continue
-            if in_tpl:
-                if c == '|':
-                    if i + 1 < length and s[i+1] == '|':
-                        i += 2
-                        continue
-                    in_tpl = False
-                i += 1
-                continue
-            i += 1
-        return -1
-
-    # Find earliest occurrence among keywords list after 'start'
-    # Returns (index, keyword) or (-1, None)
-    def find_next_any_kw(s: str, keywords, start: int) -> tuple[int, str | None]:
-        best_idx = -1
-        best_kw = None
-        for kw in keywords:
-            idx = find_kw(s, kw, start)
-            if idx != -1 and (best_idx == -1 or idx < best_idx):
-                best_idx = idx
-                best_kw = kw
-        return best_idx, best_kw
-
-    # Determine if s[pos:] begins with "UP TO <n> ROWS" ignoring case and spacing
-    up_to_rows_re = re.compile(r'\bUP\s+TO\s+\d+\s+ROWS\b', re.IGNORECASE)
-
-    # Remove SINGLE (case-insensitive) as a standalone word
-    def remove_single(stmt: str) -> str:
-        return re.sub(r'(?i)\bSINGLE\b', '', stmt)
-
-    # Remove any existing "UP TO n ROWS"
-    def remove_any_up_to_rows(stmt: str) -> str:
-        return up_to_rows_re.sub('', stmt)
+        return _SKIP_WS_COMMENTS_RE.match(s, i).end()
+
+    # Copy of a statement with comments replaced by blanks of the same length, so
+    # offsets stay valid and keyword lookups need no comment handling of their own.
+    # String literals are not masked; keyword lookups have never skipped them.
+    def mask_comments(s: str) -> str:
+        if '"' not in s and '*' not in s:
+            return s
+        return _COMMENT_RE.sub(_blank, s)
+
+    # Remove SINGLE (case-insensitive) as a standalone word, and any existing
+    # "UP TO n ROWS" when the statement may contain one
+    def remove_single_and_up_to_rows(stmt: str, may_have_up_to: bool) -> str:
+        if may_have_up_to:
+            return _SINGLE_UP_TO_ROWS_RE.sub('', stmt)
+        return _SINGLE_WORD_RE.sub('', stmt)
 
     # Normalize multiple spaces but preserve newlines and tabs
     def normalize_spaces(stmt: str) -> str:
         # Replace runs of spaces with single space, but do not collapse newlines/tabs.
-        def repl(m):
-            s = m.group(0)
-            # If contains newline/tab, keep as is
-            if '\n' in s or '\t' in s:
-                return s
-            return ' '
-        return re.sub(r'[ \t]+', repl, stmt)
+        return _MULTI_SPACE_RE.sub(' ', stmt)
 
     # Check if "ENDSELECT." already exists immediately after the statement end,
     # skipping whitespace and comment-only lines.
-    def has_endselect_after(s: str, period_pos: int) -> bool:
+    def has_endselect_after(period_pos: int) -> bool:
         i = period_pos + 1
-        i = skip_ws_and_comments(s, i)
-        # Now match ENDSELECT.
-        if i < len(s) and s[i:i+10].lower() == 'endselect.':
-            return True
-        return False
+        i = skip_ws_and_comments(code, i)
+        # Now match ENDSELECT. against the lowercased source; no per-call slice or lower()
+        return code_low.startswith('endselect.', i)
+
+    # Line start offsets, built on first use; SELECT positions only move forward,
+    # so each lookup bisects from the previous line
+    line_starts = None
+    line_lo = 0
 
-    out_parts = []
+    out = io.StringIO()
     i = 0
-    n = len(code)
-
-    while i < n:
-        # Skip whitespace/comments to find potential "select"
-        j = i
-        # Do not skip comments globally; we need to output original content as-is.
-        # We only detect SELECT SINGLE when not in string/template/comment contexts.
-        # Implement a local context scan from current position to find 'select'.
-        found = False
-
-        # Lightweight scanner to find next top-level "select"
-        scan_k = i
-        in_sq = in_bt = in_tpl = False
-        while scan_k < n:
-            c = code[scan_k]
-            if not (in_sq or in_bt or in_tpl):
-                # start of inline comment
-                if c == '"':
-                    # emit code up to this char later; but for detection, skip to EOL
-                    eol = code.find('\n', scan_k)
-                    if eol == -1:
-                        # append rest and finish
-                        out_parts.append(code[i:])
-                        return ''.join(out_parts)
-                    scan_k = eol + 1
-                    continue
-                # full-line '*' comment only if at BOL
-                if c == '*':
-                    prev = scan_k - 1
-                    if scan_k == 0 or code[prev] == '\n':
-                        # at start of line; this is a comment line, skip
-                        eol = code.find('\n', scan_k)
-                        if eol == -1:
-                            out_parts.append(code[i:])
-                            return ''.join(out_parts)
-                        scan_k = eol + 1
-                        continue
-                if c == "'":
-                    in_sq = True
-                    scan_k += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    scan_k += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    scan_k += 1
-                    continue
-                # potential 'select' start
-                if code[scan_k:scan_k+6].lower() == 'select' and (scan_k+6 <= n) and (scan_k+6 == n or not is_word_char(code[scan_k+6])):
-                    # Now verify next token after whitespace/comments is SINGLE
-                    after = scan_k + 6
-                    # Skip whitespace and comments
-                    while True:
-                        # whitespace
-                        while after < n and code[after] in (' ', '\t', '\r', '\n'):
-                            after += 1
-                        if after < n and code[after] == '"':
-                            eol = code.find('\n', after)
-                            if eol == -1:
-                                eol = n - 1
-                            after = eol + 1
-                            continue
-                        if after < n and code[after] == '*':
-                            prev = after - 1
-                            if after == 0 or code[prev] == '\n':
-                                eol = code.find('\n', after)
-                                if eol == -1:
-                                    eol = n - 1
-                                after = eol + 1
-                                continue
-                        break
-                    if after < n and code[after:after+6].lower() == 'single' and (after+6 == n or not is_word_char(code[after+6])):
-                        # Found SELECT SINGLE
-                        found = True
-                        sel_start = scan_k
-                        break
-                scan_k += 1
-                continue
-            # inside string/template
-            if in_sq:
-                if c == "'":
-                    if scan_k + 1 < n and code[scan_k+1] == "'":
-                        scan_k += 2
-                        continue
-                    in_sq = False
-                scan_k += 1
-                continue
-            if in_bt:
-                if c == '`':
-                    if scan_k + 1 < n and code[scan_k+1] == '`':
-                        scan_k += 2
-                        continue
-                    in_bt = False
-                scan_k += 1
-                continue
-            if in_tpl:
-                if c == '|':
-                    if scan_k + 1 < n and code[scan_k+1] == '|':
-                        scan_k += 2
-                        continue
-                    in_tpl = False
-                scan_k += 1
-                continue
-
-        if not found:
-            # No more SELECT SINGLE; append remainder and finish
-            out_parts.append(code[i:])
-            break
 
-        # Append content before the SELECT SINGLE as-is
-        out_parts.append(code[i:sel_start])
+    # Candidate SELECT SINGLEs come from one regex sweep; those inside comments/strings
+    # or inside the statement just rewritten are skipped
+    for m in select_re.finditer(scan_src, first.start()):
+        sel_start = m.start()
+        if sel_start < i or not in_code(sel_start):
+            continue
 
         # Find end of the SELECT statement period
-        period_pos = find_statement_period(code, sel_start)
-        if period_pos == -1:
-            # Malformed (no period); do not modify; append rest and stop
-            out_parts.append(code[sel_start:])
+        k = bisect_left(periods, sel_start)
+        if k == len(periods):
+            # Malformed (no period); do not modify; the rest is appended below
             break
+        period_pos = periods[k]
+
+        # Append content before the SELECT SINGLE as-is
+        out.write(code[i:sel_start])
 
         stmt = code[sel_start:period_pos]  # exclude period
         # For indentation and tag placement, find line start and indent
-        line_start = code.rfind('\n', 0, sel_start)
-        if line_start == -1:
-            line_start = 0
-        else:
-            line_start += 1
-        indent = ''
-        k = line_start
-        while k < sel_start and code[k] in (' ', '\t'):
-            indent += code[k]
-            k += 1
+        if line_starts is None:
+            line_starts = list(accumulate((len(line) + 1 for line in code.split('\n')[:-1]), initial=0))
+        line_lo = bisect_right(line_starts, sel_start, line_lo) - 1
+        line_start = line_starts[line_lo]
+        indent = _INDENT_RE.match(code, line_start, sel_start).group()
 
         # Transform the statement
-        # 1) Remove SINGLE
-        stmt_wo_single = remove_single(stmt)
-
-        # 2) Remove any existing UP TO n ROWS
-        stmt_wo_single_up = remove_any_up_to_rows(stmt_wo_single)
+        # 1) Remove SINGLE and 2) any existing UP TO n ROWS, in a single pass
+        # (most statements have no UP TO; only look for it if 'up' occurs at all)
+        may_have_up_to = code_low.find('up', sel_start, period_pos) != -1
 
         # Use this cleaned stmt to decide insertion points
         # Note: we operate on the cleaned string but preserve other content.
-        cleaned = stmt_wo_single_up
+        cleaned = remove_single_and_up_to_rows(stmt, may_have_up_to)
+        # Scanned once; every keyword lookup below reuses it
+        masked = mask_comments(cleaned)
+        low = masked.lower() if masked.isascii() else masked.translate(_ASCII_LOWER)
 
         # 3) Decide insertion position for "UP TO 1 ROWS"
-        where_idx = find_kw(cleaned, 'where', 0)
-        into_idx = -1 if where_idx != -1 else find_kw(cleaned, 'into', 0)
+        # One pass over the statement: the first WHERE wins, else the first INTO
+        where_idx = into_idx = -1
+        for m in _WHERE_INTO_RE.finditer(low):
+            if m.group() == 'where':
+                where_idx = m.start()
+                into_idx = -1
+                break
+            if into_idx == -1:
+                into_idx = m.start()
 
         # Compose the new statement by inserting at the right spot
         insert_phrase = ' UP TO 1 ROWS'
@@ -397,17 +196,11 @@ def process_select(code: str) -> str:
             # Insert immediately after the end of INTO clause
             search_start = into_idx + 4  # len('into')
             # Skip any spaces after 'INTO'
-            while search_start < len(cleaned) and cleaned[search_start].isspace():
-                search_start += 1
-
-            # Keywords that can validly follow the INTO target; when encountered, INTO clause ends.
-            # We purposely include: FROM, WHERE, ORDER, GROUP, HAVING, BYPASSING, CLIENT, USING,
-            # FOR (UPDATE), APPENDING, UNION, INTERSECT, EXCEPT, PACKAGE, UP (TO)
-            terminators = ['from', 'where', 'order', 'group', 'having',
-                           'bypassing', 'client', 'using', 'for',
-                           'appending', 'union', 'intersect', 'except',
-                           'package', 'up']
-            next_idx, _ = find_next_any_kw(cleaned, terminators, search_start)
+            search_start = _SPACES_RE.match(cleaned, search_start).end()
+
+            # Earliest clause keyword after the INTO target
+            m = _INTO_TERMINATOR_RE.search(low, search_start)
+            next_idx = m.start() if m else -1
             if next_idx == -1:
                 # Insert before end of statement (cleaned has no period)
                 new_stmt = cleaned.rstrip() + insert_phrase
@@ -428,16 +221,19 @@ def process_select(code: str) -> str:
         after_period_pos = period_pos + 1
 
         # Determine whether ENDSELECT. already present after statement
-        add_endselect = not has_endselect_after(code, period_pos)
+        add_endselect = not has_endselect_after(period_pos)
 
-        replacement = []
         # PwC tag line with the same indentation as the SELECT line
-        replacement.append(indent + pwc_tag_line)
+        out.write(indent)
+        out.write(pwc_tag_line)
         # Reconstructed SELECT statement plus period
-        replacement.append(new_stmt + '.')
+        out.write(new_stmt)
+        out.write('.')
         # Add ENDSELECT on a new line with the same indentation, if not already present
         if add_endselect:
-            replacement.append('\n' + indent + 'ENDSELECT.')
+            out.write('\n')
+            out.write(indent)
+            out.write('ENDSELECT.')
 
         # Preserve any whitespace (including newlines) immediately after the original period,
         # but stop before any existing ENDSELECT. we detected earlier.
@@ -454,10 +250,12 @@ def process_select(code: str) -> str:
             trailing = code[period_pos+1:k]
             # Then we'll leave existing ENDSELECT in place by not touching it (it will remain in the remainder appended below)
 
-        out_parts.append(''.join(replacement) + trailing)
+        out.write(trailing)
 
         # Advance i to right after the original period; if we added ENDSELECT, we also skip over nothing in original code,
         # because we have injected it. If we did not add ENDSELECT (it existed), we must not duplicate it; we will continue from period+1.
         i = after_period_pos
 
-    return ''.join(out_parts)
\ No newline at end of file
+    # Remainder after the last rewritten statement
+    out.write(code[i:])
+    return out.getvalue()
\ No newline at end of file
@@ -1,8 +1,67 @@
 # app/sort.py
 
+import io
 import re
+import string
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Executor
 from datetime import date
 
+from app.common import make_pwc_tag_line, map_in_processes
+from app.lex import code_regions, statement_periods
+
+# SELECT at statement lead (nothing but blanks before it on its line); searched only
+# within code slabs of the lowercased source, so no case folding is needed
+_SELECT_LEAD_RE = re.compile(r'^[ \t]*(?P<select>select)(?!\w)', re.MULTILINE)
+# FROM as a whole word, likewise searched only within code slabs of the lowercased source
+_FROM_RE = re.compile(r'(?<!\w)from(?!\w)')
+
+# Blank and comment-only lines (leading blanks allowed before '*' and '"'), then the
+# next line's leading blanks
+_NON_EXEC_LINES_RE = re.compile(r'(?:[ \t]*(?:[*"][^\n]*)?\n)*[ \t]*')
+_SPACES_RE = re.compile(r'\s*')
+# SELECT analysis patterns
+_FAE_RE = re.compile(r'\bfor\s+all\s+entries\b', re.IGNORECASE | re.DOTALL)
+# Target internal table for INTO/APPENDING TABLE forms
+_TARGET_TBL_RE = re.compile(
+    r'''
+        \b(?:into|appending)\s+
+        (?:corresponding\s+fields\s+of\s+)?    # optional 'CORRESPONDING FIELDS OF'
+        (?:table\s+)?                           # optional 'TABLE'
+        (?:
+            @data\s*\(\s*(?P<t1>[A-Za-z_]\w*)\s*\)   # @DATA(name)
+            |
+            @?(?P<t2>[A-Za-z_]\w*)                   # or possibly @name or plain name
+        )
+    ''',
+    re.IGNORECASE | re.DOTALL | re.VERBOSE,
+)
+# Field-list normalisation
+_AS_RE = re.compile(r'\bas\b', re.IGNORECASE | re.DOTALL)
+_AT_RE = re.compile(r'^@+')
+_IDENT_RE = re.compile(r'[A-Za-z_]\w*\Z')
+# "SORT <itab>" at the start of a (stripped) line
+_SORT_HEAD_RE = re.compile(r'sort\s+([A-Za-z_]\w*)\b', re.IGNORECASE | re.DOTALL)
+# ASCII-only lowercasing keeps offsets aligned with the original source
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# Opening (and closing) delimiters of string literals and templates
+_LITERAL_DELIMS = ("'", '`', '|')
+
+# Characters that can hide or nest a comma in a SELECT list
+_FIELD_NESTING_RE = re.compile(r"['`|()]")
+# Characters the field-list tokenizer acts on; everything else is copied in runs
+_FIELD_STOP_RE = re.compile(r"['`|(),]")
+
+def _skip_literal(s: str, i: int) -> int:
+    # s[i] opens a literal; returns the index just past its closing delimiter (a
+    # doubled delimiter is an escape), or len(s) if it is unterminated
+    c = s[i]
+    k = s.find(c, i + 1)
+    while k != -1 and k + 1 < len(s) and s[k+1] == c:
+        k = s.find(c, k + 2)
+    return len(s) if k == -1 else k + 1
+
 def process_sort(code: str) -> str:
     """
     Remediate ABAP SELECT statements that:
@@ -27,243 +86,53 @@ def process_sort(code: str) -> str:
         "SORT <itab> ..." it will not insert another one.
     """
 
-    pwc_tag_line = f'" Added By Pwc {date.today().isoformat()}\n'
-
-    # ----------------- Lexical utilities (skip comments/strings) -----------------
+    pwc_tag_line = make_pwc_tag_line(date.today())
 
-    def is_word_char(c: str) -> bool:
-        return c.isalnum() or c == '_'
+    # Only SELECTs with FOR ALL ENTRIES are touched; most sources have none at all.
+    # The phrase is located once and drives the main loop, so other SELECTs are
+    # never looked at.
+    fae_positions = [m.start() for m in _FAE_RE.finditer(code)]
+    if not fae_positions:
+        return code
 
-    def match_kw_at(s: str, i: int, kw: str) -> bool:
-        n = len(kw)
-        if i < 0 or i + n > len(s):
-            return False
-        if s[i:i+n].lower() != kw.lower():
-            return False
-        left_ok = (i == 0) or (not is_word_char(s[i-1]))
-        right_ok = (i + n == len(s)) or (not is_word_char(s[i+n]))
-        return left_ok and right_ok
-
-    def skip_line_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '"'; returns index at end-of-line (position of '\n' or len)
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def skip_full_line_star_comment(s: str, i: int) -> int:
-        # Assumes s[i] == '*' and it's at BOL; returns index at end-of-line
-        eol = s.find('\n', i)
-        return len(s) if eol == -1 else eol
-
-    def find_statement_period(s: str, start: int) -> int:
-        # Returns the index of the '.' that terminates the ABAP statement starting at 'start'
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i)
-                    continue
-                if c == '*':
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i)
-                        continue
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-                if c == '.':
-                    return i
-                i += 1
-            else:
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            i += 2
-                            continue
-                        in_sq = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            i += 2
-                            continue
-                        in_bt = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            i += 2
-                            continue
-                        in_tpl = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-        return -1
-
-    def find_kw(s: str, kw: str, start: int = 0) -> int:
-        # Finds next occurrence of keyword outside strings/comments with word boundaries
-        i = start
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    i = skip_line_comment(s, i) + 1
-                    continue
-                if c == '*':
-                    if i == 0 or s[i-1] == '\n':
-                        i = skip_full_line_star_comment(s, i) + 1
-                        continue
-                if c == "'":
-                    in_sq = True
-                    i += 1
-                    continue
-                if c == '`':
-                    in_bt = True
-                    i += 1
-                    continue
-                if c == '|':
-                    in_tpl = True
-                    i += 1
-                    continue
-                if match_kw_at(s, i, kw):
-                    return i
-                i += 1
-            else:
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            i += 2
-                            continue
-                        in_sq = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            i += 2
-                            continue
-                        in_bt = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            i += 2
-                            continue
-                        in_tpl = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-        return -1
+    # Lowercased once; keyword scans run over it instead of folding case per match
+    code_lower = code.lower() if code.isascii() else code.translate(_ASCII_LOWER)
 
-    def at_statement_lead(s: str, pos: int) -> bool:
-        # True if 'pos' is the first non-space/tab character of its line and that line isn't a '*' comment line
-        ls = s.rfind('\n', 0, pos)
-        ls = 0 if ls == -1 else ls + 1
-        k = ls
-        while k < pos and s[k] in (' ', '\t'):
-            k += 1
-        if k < len(s) and s[k] == '*':
-            return False
-        return k == pos
+    # ----------------- Lexical utilities (skip comments/strings) -----------------
 
     def next_executable_line_start(s: str, start: int) -> int:
         # Returns index of first character of the next non-empty, non-comment line starting at 'start'
-        i = start
         n = len(s)
-        while i < n:
-            # move to line start
-            if i == 0 or s[i-1] == '\n':
-                # skip blank
-                j = i
-                while j < n and s[j] in (' ', '\t'):
-                    j += 1
-                if j >= n:
-                    return n
-                if s[j] == '\n':
-                    i = j + 1
-                    continue
-                # skip full-line '*' comment
-                if s[j] == '*':
-                    i = skip_full_line_star_comment(s, j) + 1
-                    continue
-                # skip inline-quote comment-only line
-                if s[j] == '"':
-                    i = skip_line_comment(s, j) + 1
-                    continue
-                return j
-            i += 1
-        return n
+        if start > 0 and s[start-1] != '\n':
+            # move to the next line start
+            eol = s.find('\n', start)
+            if eol == -1:
+                return n
+            start = eol + 1
+        # skip blank, '*' and '"' comment-only lines
+        j = _NON_EXEC_LINES_RE.match(s, start).end()
+        if j >= n or s[j] in ('*', '"'):
+            # only blanks/comments up to the end (the last line has no newline)
+            return n
+        return j
 
     # ----------------- Helpers to analyze SELECT statement -----------------
 
-    fae_re = re.compile(r'(?is)\bfor\s+all\s+entries\b')
-    order_by_re = re.compile(r'(?is)\border\s+by\b')  # not directly used but kept for completeness
-
-    # Extract the target internal table for INTO/APPENDING TABLE forms
-    target_tbl_re = re.compile(
-        r'''(?isx)
-            \b(?:into|appending)\s+
-            (?:corresponding\s+fields\s+of\s+)?    # optional 'CORRESPONDING FIELDS OF'
-            (?:table\s+)?                           # optional 'TABLE'
-            (?:
-                @data\s*\(\s*(?P<t1>[A-Za-z_]\w*)\s*\)   # @DATA(name)
-                |
-                @?(?P<t2>[A-Za-z_]\w*)                   # or possibly @name or plain name
-            )
-        '''
-    )
-
-    def extract_target_table(stmt: str) -> str | None:
-        m = target_tbl_re.search(stmt)
+    def extract_target_table(stmt: str) -> str:
+        # '' when there is no INTO/APPENDING target
+        m = _TARGET_TBL_RE.search(stmt)
         if not m:
-            return None
+            return ''
         t = m.group('t1') or m.group('t2')
         return t
 
-    def extract_select_list(stmt: str) -> str:
-        # stmt is the full SELECT statement without trailing period
-        sel_idx = find_kw(stmt, 'select', 0)
-        if sel_idx == -1:
-            return ''
-        i = sel_idx + 6
-        n = len(stmt)
-        while i < n and stmt[i].isspace():
-            i += 1
-        from_idx = find_kw(stmt, 'from', i)
+    def extract_select_list(sel_pos: int, end: int) -> str:
+        # code[sel_pos:end] is the full SELECT statement without trailing period
+        i = _SPACES_RE.match(code, sel_pos + 6, end).end()
+        from_idx = find_kw(_FROM_RE, i, end)
         if from_idx == -1:
             return ''
-        return stmt[i:from_idx].strip()
+        return code[i:from_idx].strip()
 
     def split_fields(field_segment: str) -> list[str]:
         """
@@ -277,89 +146,23 @@ def process_sort(code: str) -> str:
         if not s:
             return []
         # handle DISTINCT
-        if s.lower().startswith('distinct'):
+        if s[:8].lower() == 'distinct':
             s = s[8:].lstrip()
         # trivial star or dynamic list "(...)"
         if s == '*' or s.startswith('('):
             return ['*']
 
-        # Tokenize respecting parentheses, quotes, templates; split on commas at depth 0
-        items = []
-        buf = []
-        depth = 0
-        i = 0
-        n = len(s)
-        in_sq = in_bt = in_tpl = False
-        while i < n:
-            c = s[i]
-            if not (in_sq or in_bt or in_tpl):
-                if c == "'":
-                    in_sq = True
-                    buf.append(c); i += 1; continue
-                if c == '`':
-                    in_bt = True
-                    buf.append(c); i += 1; continue
-                if c == '|':
-                    in_tpl = True
-                    buf.append(c); i += 1; continue
-                if c == '(':
-                    depth += 1; buf.append(c); i += 1; continue
-                if c == ')':
-                    depth = max(0, depth - 1); buf.append(c); i += 1; continue
-                if depth == 0 and c == ',':
-                    item = ''.join(buf).strip()
-                    if item:
-                        items.append(item)
-                    buf = []
-                    i += 1
-                    continue
-                buf.append(c); i += 1
-            else:
-                # inside string/template
-                buf.append(c)
-                if in_sq:
-                    if c == "'":
-                        if i + 1 < n and s[i+1] == "'":
-                            buf.append(s[i+1]); i += 2; continue
-                        in_sq = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if i + 1 < n and s[i+1] == '`':
-                            buf.append(s[i+1]); i += 2; continue
-                        in_bt = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if i + 1 < n and s[i+1] == '|':
-                            buf.append(s[i+1]); i += 2; continue
-                        in_tpl = False
-                    else:
-                        i += 1
-                        continue
-                    i += 1
-                    continue
-        last = ''.join(buf).strip()
-        if last:
-            items.append(last)
-
-        # If there were no commas, items may still contain space-separated tokens. Split conservatively.
         if ',' not in field_segment:
+            # If there are no commas, items are space-separated tokens. Split conservatively.
             # Break by whitespace into candidates; keep 'AS alias' together
             tokens = s.split()
+            # lowercased once for the AS checks (lowercasing never adds or removes blanks)
+            tokens_lower = s.lower().split()
             # Reconstruct items by splitting when a token looks like a field-reference or alias boundary
             items = []
             k = 0
             while k < len(tokens):
-                if tokens[k].lower() == 'as' and k + 1 < len(tokens):
+                if tokens_lower[k] == 'as' and k + 1 < len(tokens):
                     if items:
                         items.append(tokens[k-1] + ' AS ' + tokens[k+1])
                     else:
@@ -368,6 +171,45 @@ def process_sort(code: str) -> str:
                 else:
                     items.append(tokens[k])
                     k += 1
+        elif not _FIELD_NESTING_RE.search(s):
+            # No literals or parentheses: every comma is at depth 0
+            items = [item for item in (part.strip() for part in s.split(',')) if item]
+        else:
+            # Tokenize respecting parentheses, quotes, templates; split on commas at depth 0
+            items = []
+            buf = []
+            depth = 0
+            i = 0
+            n = len(s)
+            while i < n:
+                # jump over ordinary characters to the next one that matters
+                m = _FIELD_STOP_RE.search(s, i)
+                if not m:
+                    buf.append(s[i:])
+                    break
+                j = m.start()
+                if j > i:
+                    buf.append(s[i:j])
+                i = j
+                c = s[i]
+                if c in _LITERAL_DELIMS:
+                    j = _skip_literal(s, i)
+                    buf.append(s[i:j]); i = j; continue
+                if c == '(':
+                    depth += 1; buf.append(c); i += 1; continue
+                if c == ')':
+                    depth = max(0, depth - 1); buf.append(c); i += 1; continue
+                if depth == 0:
+                    item = ''.join(buf).strip()
+                    if item:
+                        items.append(item)
+                    buf = []
+                    i += 1
+                    continue
+                buf.append(c); i += 1
+            last = ''.join(buf).strip()
+            if last:
+                items.append(last)
 
         # Normalize each item to a usable component name
         out_fields = []
@@ -381,7 +223,7 @@ def process_sort(code: str) -> str:
                 if inner:
                     t = inner
             # Check alias
-            m_as = re.search(r'(?is)\bas\b', t)
+            m_as = _AS_RE.search(t)
             if m_as:
                 alias = t[m_as.end():].strip()
                 if alias:
@@ -400,12 +242,13 @@ def process_sort(code: str) -> str:
             if '(' in t or ')' in t:
                 continue
             # Exclude keywords
-            if t.lower() in ('distinct',):
+            if len(t) == 8 and t.lower() == 'distinct':
                 continue
             # Clean leading host var marker
-            t = re.sub(r'^[@]+', '', t)
-            # Accept identifier-like tokens only
-            if re.match(r'^[A-Za-z_]\w*$', t):
+            t = _AT_RE.sub('', t)
+            # Accept identifier-like tokens only; for ASCII text isidentifier() is
+            # exactly [A-Za-z_]\w*, the regex is only needed for other text
+            if t.isidentifier() if t.isascii() else _IDENT_RE.match(t):
                 out_fields.append(t)
 
         # Deduplicate preserving order
@@ -418,9 +261,6 @@ def process_sort(code: str) -> str:
                 res.append(f)
         return res if res else []
 
-    def has_for_all_entries(stmt: str) -> bool:
-        return fae_re.search(stmt) is not None
-
     def is_sort_immediately_next_for_target(s: str, period_pos: int, target: str) -> bool:
         start = next_executable_line_start(s, period_pos + 1)
         if start >= len(s):
@@ -433,132 +273,104 @@ def process_sort(code: str) -> str:
         if q != -1:
             line = line[:q]
         line = line.strip()
-        m = re.match(r'(?is)^sort\s+([A-Za-z_]\w*)\b', line)
+        m = _SORT_HEAD_RE.match(line)
         if not m:
             return False
         return m.group(1).lower() == target.lower()
 
-    def get_line_indent_before(pos: int) -> str:
-        ls = code.rfind('\n', 0, pos)
-        ls = 0 if ls == -1 else ls + 1
-        k = ls
-        indent = []
-        while k < pos and code[k] in (' ', '\t'):
-            indent.append(code[k]); k += 1
-        return ''.join(indent)
-
     # ----------------- Main scanning loop -----------------
 
-    out_parts = []
+    # Source text is only copied out when a SORT is inserted; everything from
+    # 'last' on is still pending and is written in one piece at the end. StringIO
+    # is kept over an encoded bytearray: for ASCII text it copies compact 1-byte
+    # data directly, while encode/extend/decode measured about 3x slower.
+    buf = io.StringIO()
+    last = 0
     i = 0
-    n = len(code)
-
-    while i < n:
-        # Find next "select" token at statement lead, outside strings/comments
-        scan = i
-        in_sq = in_bt = in_tpl = False
-        sel_pos = -1
-        while scan < n:
-            c = code[scan]
-            if not (in_sq or in_bt or in_tpl):
-                if c == '"':
-                    scan = skip_line_comment(code, scan)
-                    if scan < n: scan += 1
-                    continue
-                if c == '*':
-                    if scan == 0 or code[scan-1] == '\n':
-                        scan = skip_full_line_star_comment(code, scan)
-                        if scan < n: scan += 1
-                        continue
-                if c == "'":
-                    in_sq = True; scan += 1; continue
-                if c == '`':
-                    in_bt = True; scan += 1; continue
-                if c == '|':
-                    in_tpl = True; scan += 1; continue
-                if code[scan:scan+6].lower() == 'select' and (scan+6 == n or not is_word_char(code[scan+6])) and at_statement_lead(code, scan):
-                    sel_pos = scan
-                    break
-                scan += 1
-            else:
-                # Ensure we always advance inside string/template blocks to avoid infinite loops
-                if in_sq:
-                    if c == "'":
-                        if scan + 1 < n and code[scan+1] == "'":
-                            scan += 2
-                            continue
-                        in_sq = False
-                    else:
-                        scan += 1
-                        continue
-                    scan += 1
-                    continue
-                if in_bt:
-                    if c == '`':
-                        if scan + 1 < n and code[scan+1] == '`':
-                            scan += 2
-                            continue
-                        in_bt = False
-                    else:
-                        scan += 1
-                        continue
-                    scan += 1
-                    continue
-                if in_tpl:
-                    if c == '|':
-                        if scan + 1 < n and code[scan+1] == '|':
-                            scan += 2
-                            continue
-                        in_tpl = False
-                    else:
-                        scan += 1
-                        continue
-                    scan += 1
-                    continue
 
-        if sel_pos == -1:
-            out_parts.append(code[i:])
-            break
+    # The source is lexed once: SELECT is only searched for in code slabs (so never
+    # inside strings/comments), and statement ends come from the precomputed periods
+    regions = code_regions(code)
+    periods = statement_periods(code, regions)
+
+    region_starts = [a for a, b in regions]
+    # split_fields results per distinct SELECT list (read-only once stored)
+    fields_by_list = {}
+
+    def find_kw(kw_re: re.Pattern, start: int, end: int) -> int:
+        # Offset of the first kw_re match in code_lower[start:end] within code slabs
+        # (so never inside strings/comments), or -1
+        r = max(bisect_right(region_starts, start) - 1, 0)
+        while r < len(regions) and regions[r][0] < end:
+            a, b = regions[r]
+            m = kw_re.search(code_lower, max(a, start), min(b, end))
+            if m:
+                return m.start()
+            r += 1
+        return -1
 
-        # Append content before SELECT as-is
-        out_parts.append(code[i:sel_pos])
+    def first_select_lead(start: int, end: int) -> tuple[int, int]:
+        # (line start, SELECT offset) of the first SELECT at statement lead in code slabs
+        # from 'start', if it begins before 'end'; (-1, -1) otherwise. The match starts
+        # at the line start, so the text up to SELECT is the line indent.
+        r = max(bisect_right(region_starts, start) - 1, 0)
+        while r < len(regions) and regions[r][0] < end:
+            a, b = regions[r]
+            m = _SELECT_LEAD_RE.search(code_lower, max(a, start), b)
+            if m:
+                if m.start('select') < end:
+                    return m.start(), m.start('select')
+                return -1, -1
+            r += 1
+        return -1, -1
+
+    # Keep the locals of this loop (and of the helpers it calls) one type each: offsets
+    # are always int with -1 for "none" (never None), text is always str, and fields
+    # always a list. Monomorphic locals let CPython's adaptive interpreter keep its
+    # specialised instructions (3.11+), and the module gains the most from a PGO/LTO
+    # CPython build when its hot loops stay type-stable like this.
+    for fae_pos in fae_positions:
+        if fae_pos < i:
+            # inside the statement just processed
+            continue
 
         # Determine end of statement
-        period_pos = find_statement_period(code, sel_pos)
-        if period_pos == -1:
-            # malformed; append remainder and stop
-            out_parts.append(code[sel_pos:])
+        k = bisect_left(periods, fae_pos)
+        if k == len(periods):
+            # malformed (no period); leave the remainder as is and stop
             break
+        period_pos = periods[k]
 
-        stmt = code[sel_pos:period_pos]  # without '.'
-
-        # Condition: must have FOR ALL ENTRIES
-        if not has_for_all_entries(stmt):
-            # no change
-            out_parts.append(code[sel_pos:period_pos + 1])
-            i = period_pos + 1
+        # The SELECT owning this FOR ALL ENTRIES leads the statement the phrase is in:
+        # a later SELECT in the same statement was never a statement of its own
+        line_start, sel_pos = first_select_lead(periods[k-1] + 1 if k else 0, fae_pos)
+        if sel_pos == -1:
+            # not part of a SELECT statement
             continue
 
+        stmt = code[sel_pos:period_pos]  # without '.'
+
         # Determine target internal table
         target = extract_target_table(stmt)
         if not target:
             # Could not determine target table reliably; do not modify
-            out_parts.append(code[sel_pos:period_pos + 1])
             i = period_pos + 1
             continue
 
         # If next executable statement is already SORT <target>, skip
         if is_sort_immediately_next_for_target(code, period_pos, target):
-            out_parts.append(code[sel_pos:period_pos + 1])
             i = period_pos + 1
             continue
 
         # Build fields list from SELECT list
-        select_list = extract_select_list(stmt)
-        fields = split_fields(select_list)
+        select_list = extract_select_list(sel_pos, period_pos)
+        # The same SELECT list often recurs within a source; split each one once
+        if select_list not in fields_by_list:
+            fields_by_list[select_list] = split_fields(select_list)
+        fields = fields_by_list[select_list]
 
         # Compose SORT statement
-        indent = get_line_indent_before(sel_pos)
+        indent = code[line_start:sel_pos]
         if not fields or fields == ['*'] or any(f.strip() == '*' for f in fields):
             sort_stmt = f"{indent}SORT {target}."
         else:
@@ -568,9 +380,24 @@ def process_sort(code: str) -> str:
         # Insert: SELECT... . <newline> SORT ... <newline> " PwC tag
         insertion = '\n' + sort_stmt + '\n' + indent + pwc_tag_line
 
-        out_parts.append(code[sel_pos:period_pos + 1] + insertion)
+        # Flush everything up to and including the period as-is, then the insertion
+        buf.write(code[last:period_pos + 1])
+        buf.write(insertion)
+        last = period_pos + 1
 
         # Continue after original period
         i = period_pos + 1
 
-    return ''.join(out_parts)
\ No newline at end of file
+    if not buf.tell():
+        # No SORT inserted: return the source object itself instead of a copy
+        return code
+    buf.write(code[last:])
+    return buf.getvalue()
+
+def process_sort_many(codes: list[str], executor: Executor | None = None) -> list[str]:
+    """
+    Apply process_sort to several sources, sharded across worker processes
+    (see map_in_processes; pass executor to reuse an existing pool).
+    Results keep the input order.
+    """
+    return map_in_processes(process_sort, codes, executor)
\ No newline at end of file